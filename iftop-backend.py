@@ -4,6 +4,8 @@ iftop WebSocket Backend
 
 Installation requirements:
     pip install websockets
+    pip install orjson  # optional, faster JSON encoding
+    pip install uvloop  # optional, faster event loop
 
 Usage:
     python iftop_backend.py
@@ -12,16 +14,39 @@ The server will listen on ws://localhost:8766
 """
 
 import asyncio
+import dataclasses
 import ipaddress
 import json
+import re
 import subprocess
+import time
 import websockets
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_dumps(obj) -> str:
+    # Send text frames; the frontend JSON.parse()s event.data directly
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_DATACLASS).decode()
+    return json.dumps(obj, default=dataclasses.asdict)
+
+
+def json_loads(message):
+    if orjson is not None:
+        return orjson.loads(message)
+    return json.loads(message)
 
 
 def load_hosts():
     hosts = {}
     try:
-        ethers = dict(map(lambda x: x.strip().split(), open("/usr/local/etc/ethers").readlines()))
+        with open("/usr/local/etc/ethers") as f:
+            ethers = {p[0]: p[1] for line in f if len(p := line.split()) >= 2}
     except FileNotFoundError as e:
         ethers = {}
     try:
@@ -42,39 +67,202 @@ def load_hosts():
     return hosts
 
 
-def classify(conn, hosts):
-    for h in ["txhost", "rxhost"]:
-        if conn[h] in hosts:
-            conn[h] += f"[{hosts[conn[h]]}]"
-
-    for port, desc in [
-        (22, "SSH"),
-        (80, "HTTP"),
-        (143, "IMAP"),
-        (443, "HTTPS"),
-        (16393, "FaceTime"),
-        (25565, "MineCraft"),
-    ]:
-        if int(conn.get("txport") or 0) == port or int(conn.get("rxport") or 0) == port:
-            conn["description"] = desc
+HOSTS_TTL = 60  # seconds
+_hosts_cache = (None, {})
+
+
+async def get_hosts():
+    """Return the host name map, refreshing it off the event loop when stale."""
+    global _hosts_cache
+    now = time.monotonic()
+    if _hosts_cache[0] is not None and now - _hosts_cache[0] < HOSTS_TTL:
+        return _hosts_cache[1]
+    hosts = await asyncio.to_thread(load_hosts)
+    _hosts_cache = (now, hosts)
+    return hosts
+
+
+@dataclasses.dataclass(slots=True)
+class Connection:
+    description: str = "Unknown"
+    txhost: str = ""
+    txport: int = 0
+    tx2s: float = 0
+    tx10s: float = 0
+    tx40s: float = 0
+    txcum: float = 0
+    rxhost: str = ""
+    rxport: int = 0
+    rx2s: float = 0
+    rx10s: float = 0
+    rx40s: float = 0
+    rxcum: float = 0
+
+
+_PORT_DESC = {
+    22: "SSH",
+    80: "HTTP",
+    143: "IMAP",
+    443: "HTTPS",
+    16393: "FaceTime",
+    25565: "MineCraft",
+}
+
+
+def classify(conn, hosts, seen):
+    # Connections persist across frames, so reuse the labels from last time
+    key = (conn.txhost, conn.txport, conn.rxhost, conn.rxport)
+    if key in seen:
+        conn.txhost, conn.rxhost, conn.description = seen[key]
+        return
+
+    if conn.txhost in hosts:
+        conn.txhost += f"[{hosts[conn.txhost]}]"
+    if conn.rxhost in hosts:
+        conn.rxhost += f"[{hosts[conn.rxhost]}]"
+
+    desc = _PORT_DESC.get(conn.txport) or _PORT_DESC.get(conn.rxport)
+    if desc:
+        conn.description = desc
+    seen[key] = (conn.txhost, conn.rxhost, conn.description)
     return
 
 
+_RATE_RE = re.compile(r"([0-9.]+)([KMG]?)B?", re.IGNORECASE)
+_RATE_MULT = {"": 1.0, "k": 1e3, "m": 1e6, "g": 1e9}
+
+
+@lru_cache(maxsize=4096)
 def parse_rate(rate: str) -> float:
-    if rate.endswith("Gb") or rate.endswith("GB"):
-        return float(rate[:-2]) * 1000000000
-    if rate.endswith("Mb") or rate.endswith("MB"):
-        return float(rate[:-2]) * 1000000
-    if rate.endswith("Kb") or rate.endswith("KB"):
-        return float(rate[:-2]) * 1000
-    if rate.endswith("b") or rate.endswith("B"):
-        return float(rate[:-1])
+    m = _RATE_RE.fullmatch(rate)
+    if not m:
+        return 0
     try:
-        return float(rate)
+        return float(m.group(1)) * _RATE_MULT[m.group(2).lower()]
     except ValueError:
         return 0
 
 
+def parse_total(line, data):
+    parts = line.split()
+    if parts[1] == "receive":
+        data["total"].update({
+            "rx2s": parse_rate(parts[3]),
+            "rx10s": parse_rate(parts[4]),
+            "rx40s": parse_rate(parts[5]),
+        })
+    elif parts[2] == "and":
+        data["total"].update({
+            "2s": parse_rate(parts[5]),
+            "10s": parse_rate(parts[6]),
+            "40s": parse_rate(parts[7]),
+        })
+    else:
+        data["total"] = {
+            "tx2s": parse_rate(parts[3]),
+            "tx10s": parse_rate(parts[4]),
+            "tx40s": parse_rate(parts[5]),
+        }
+
+
+def parse_peak(line, data):
+    parts = line.split()
+    data["peak"] = {
+        "2s": parse_rate(parts[3]),
+        "10s": parse_rate(parts[4]),
+        "40s": parse_rate(parts[5]),
+    }
+
+
+def parse_cumulative(line, data):
+    parts = line.split()
+    data["cum"] = {
+        "2s": parse_rate(parts[2]),
+        "10s": parse_rate(parts[3]),
+        "40s": parse_rate(parts[4]),
+    }
+
+
+# iftop summary lines, keyed by their first four characters
+_SUMMARY_HANDLERS = {
+    "Tota": parse_total,
+    "Peak": parse_peak,
+    "Cumu": parse_cumulative,
+}
+
+
+def parse_connection(parts, data):
+    if parts[0].isdigit():
+        data.setdefault("connections", []).append(Connection())
+        parts.pop(0)
+    conn = data["connections"][-1]
+    host, _, port = parts[0].rpartition(":")
+    rates = [parse_rate(p) for p in parts[2:6]]
+    if "=>" in parts:
+        conn.txhost, conn.txport = host, int(port)
+        conn.tx2s, conn.tx10s, conn.tx40s, conn.txcum = rates
+    else:
+        conn.rxhost, conn.rxport = host, int(port)
+        conn.rx2s, conn.rx10s, conn.rx40s, conn.rxcum = rates
+
+
+def parse_line(line, data):
+    """Fold one non-boundary line of iftop text output into the frame data."""
+    handler = _SUMMARY_HANDLERS.get(line[:4])
+    # Only receive rows start with a host name, and they contain "<="
+    if handler is not None and "<=" not in line:
+        handler(line, data)
+        return
+
+    parts = line.split()
+    if "=>" in parts or "<=" in parts:
+        parse_connection(parts, data)
+
+
+async def read_lines(stream, queue):
+    """Drain stream in bulk reads and queue decoded lines, then None at EOF."""
+    buf = ""
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        # iftop output is ASCII; decoding per byte means chunks can split anywhere
+        buf += chunk.decode('ascii', 'replace')
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            await queue.put(line)
+    if buf:
+        await queue.put(buf)
+    await queue.put(None)
+
+
+def put_latest(queue, item):
+    """Queue item, dropping the oldest entry if the queue is full."""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(item)
+
+
+async def send_frames(websocket, frames):
+    """Send queued frames to the client until a None sentinel arrives."""
+    while (frame := await frames.get()) is not None:
+        await asyncio.shield(websocket.send(json_dumps(frame)))
+
+
+async def stop_iftop(process, timeout=2.0):
+    """Terminate iftop and reap it, killing it if it ignores SIGTERM."""
+    if process.returncode is None:
+        try:
+            process.terminate()
+        except ProcessLookupError:
+            pass
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
 async def run_iftop(interface: str, websocket):
     """
     Run iftop test for a specific interface.
@@ -83,6 +271,9 @@ async def run_iftop(interface: str, websocket):
         interface: network interface name
         websocket: WebSocket connection to send updates
     """
+    process = None
+    reader = None
+    sender = None
     try:
         # Build iftop command
         cmd = [
@@ -98,7 +289,7 @@ async def run_iftop(interface: str, websocket):
             stderr=asyncio.subprocess.PIPE
         )
         
-        await websocket.send(json.dumps({
+        await websocket.send(json_dumps({
             "connections": [{
                 "description": "Waiting",
                 "txhost": "--",
@@ -124,107 +315,67 @@ async def run_iftop(interface: str, websocket):
             }
         }))
 
-        hosts = load_hosts()
+        hosts = await get_hosts()
+
+        lines = asyncio.Queue()
+        reader = asyncio.create_task(read_lines(process.stdout, lines))
+
+        # Frames are snapshots, so a slow client only ever gets the latest few
+        frames = asyncio.Queue(maxsize=4)
+        sender = asyncio.create_task(send_frames(websocket, frames))
 
+        classified = {}
         data = {}
         cnt = 0
         # Read output line by line
         while True:
-            line = await process.stdout.readline()
-            line = line.decode('utf-8').strip()
+            line = await lines.get()
+            if line is None:
+                break
+            line = line.strip()
             if not line:
                 continue
 
-            parts = line.split()
-           
             try:
-                if line.startswith("===="):
+                if line[0] == "=":
                     for conn in data.get("connections", []):
-                        classify(conn, hosts)
-                    data["connections"].insert(0, {
-                        **data["total"],
-                        "description": "Total",
-                        "txhost": "0.0.0.0",
-                        "txport": "0",
-                        "rxhost": "0.0.0.0",
-                        "rxport": "0",
-                    })
-                    await websocket.send(json.dumps(data))
-                    data.clear()
+                        classify(conn, hosts, classified)
+                    total = data["total"]
+                    data["connections"] = [
+                        Connection(
+                            description="Total",
+                            txhost="0.0.0.0",
+                            tx2s=total["tx2s"],
+                            tx10s=total["tx10s"],
+                            tx40s=total["tx40s"],
+                            rxhost="0.0.0.0",
+                            rx2s=total["rx2s"],
+                            rx10s=total["rx10s"],
+                            rx40s=total["rx40s"],
+                        ),
+                        *data.get("connections", []),
+                    ]
+                    if sender.done():
+                        break
+                    put_latest(frames, data)
+                    data = {}
                     cnt += 1
                     if cnt >= 300:  # End after 10 minutes
-                        process.terminate()
                         break
                     continue
 
-                if "=>" in parts or "<=" in parts:
-                    if parts[0].isdigit():
-                        data.setdefault("connections", []).append({
-                            "description": "Unknown",
-                        })
-                        parts.pop(0)
-                    d = "tx" if "=>" in parts else "rx"
-                    data["connections"][-1].update({
-                        f"{d}host": parts[0].split(":")[0],
-                        f"{d}port": parts[0].split(":")[1],
-                        f"{d}2s": parse_rate(parts[2]),
-                        f"{d}10s": parse_rate(parts[3]),
-                        f"{d}40s": parse_rate(parts[4]),
-                        f"{d}cum": parse_rate(parts[5]),
-                    })
-                    continue
-
-                if "Total send rate" in line:
-                    data["total"] = {
-                        "tx2s": parse_rate(parts[3]),
-                        "tx10s": parse_rate(parts[4]),
-                        "tx40s": parse_rate(parts[5]),
-                    }
-                    continue
+                parse_line(line, data)
 
-                if "Total receive rate" in line:
-                    data["total"].update({
-                        "rx2s": parse_rate(parts[3]),
-                        "rx10s": parse_rate(parts[4]),
-                        "rx40s": parse_rate(parts[5]),
-                    })
-                    continue
-
-                if "Total send and receive rate" in line:
-                    data["total"].update({
-                        "2s": parse_rate(parts[5]),
-                        "10s": parse_rate(parts[6]),
-                        "40s": parse_rate(parts[7]),
-                    })
-                    continue
-
-                if "Peak rate" in line:
-                    data["peak"] = {
-                        "2s": parse_rate(parts[3]),
-                        "10s": parse_rate(parts[4]),
-                        "40s": parse_rate(parts[5]),
-                    }
-                    continue
-
-                if "Cumulative" in line:
-                    data["cum"] = {
-                        "2s": parse_rate(parts[2]),
-                        "10s": parse_rate(parts[3]),
-                        "40s": parse_rate(parts[4]),
-                    }
-                    continue
-
-            except websockets.exceptions.ConnectionClosed:
-                process.terminate()
-                break
             except Exception as e:
                 print(f"Error parsing iftop output: {e}")
                 print(line)
-                print(parts)
                 continue
-        
-        # Wait for process to complete
-        await process.wait()
+
+        if not sender.done():
+            put_latest(frames, None)
+        await sender
+
+        await stop_iftop(process)
         
         # Check for errors
         if process.returncode != 0 and False:  # Debugging
@@ -240,19 +391,27 @@ async def run_iftop(interface: str, websocket):
 
     except Exception as e:
         print(f"Error running iftop: {e}")
-        await websocket.send(json.dumps({
+        await websocket.send(json_dumps({
             'type': 'error',
             'interface': interface,
             'message': str(e)
         }))
         return 0
 
+    finally:
+        if reader is not None:
+            reader.cancel()
+        if sender is not None:
+            sender.cancel()
+        if process is not None:
+            await stop_iftop(process)
+
 
 async def handle_client(websocket, path):
     """Handle WebSocket client connection."""
     try:
         async for message in websocket:
-            data = json.loads(message)
+            data = json_loads(message)
             interface = data.get('interface')
             
             await run_iftop(interface, websocket)
@@ -262,7 +421,7 @@ async def handle_client(websocket, path):
     except Exception as e:
         print(f"Error handling client: {e}")
         try:
-            await websocket.send(json.dumps({
+            await websocket.send(json_dumps({
                 'type': 'error',
                 'message': str(e)
             }))
@@ -275,11 +434,26 @@ async def main():
     print("Starting iftop WebSocket server on ws://localhost:8766")
     print("Make sure iftop is installed and available in your PATH")
     
-    async with websockets.serve(handle_client, "0.0.0.0", 8766):
+    # Frames are small JSON snapshots every 2s; deflate only costs CPU here
+    async with websockets.serve(
+        handle_client,
+        "0.0.0.0",
+        8766,
+        compression=None,
+        max_size=2**20,
+        max_queue=8,
+        write_limit=2**16,
+    ):
         await asyncio.Future()  # Run forever
 
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt: